@@ -0,0 +1,6 @@
+"""
+KouriChat-NoneBot 性能基准测试
+使用假的大模型和合成的OneBot V11消息流驱动 MessageManager 和 BaseLLM
+
+在项目根目录运行：python -m benchmarks --help
+"""
@@ -0,0 +1,54 @@
+import argparse
+import sys
+from benchmarks.baseline import run_cli
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.traffic import generate_traffic
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="MessageManager + BaseLLM 端到端基准测试")
+    traffic = parser.add_argument_group("合成流量")
+    traffic.add_argument("--users", type=int, default=1000, help="模拟用户数")
+    traffic.add_argument("--duration", type=float, default=10.0, help="流量持续时间（秒）")
+    traffic.add_argument("--bursts", type=float, default=1.5, help="每个用户的平均连发次数")
+    traffic.add_argument("--burst-size", type=int, default=4, help="每次连发的平均消息条数")
+    traffic.add_argument("--burst-gap", type=float, default=0.3, help="连发内消息的平均间隔（秒）")
+    traffic.add_argument("--seed", type=int, default=0, help="随机种子")
+    llm = parser.add_argument_group("假大模型")
+    llm.add_argument("--latency", type=float, default=0.05, help="首token延迟（秒）")
+    llm.add_argument("--token-rate", type=float, default=2000.0, help="生成速率（token/秒），0为瞬间生成")
+    llm.add_argument("--response-tokens", type=int, default=40, help="每次回复的token数")
+    pipeline = parser.add_argument_group("消息管道")
+    pipeline.add_argument("--time-interval", type=float, default=0.5, help="消息队列防抖等待时间（秒）")
+    pipeline.add_argument("--speed", type=float, default=1.0, help="送入速度倍数，0为尽快送入")
+    pipeline.add_argument("--drain-timeout", type=float, default=600.0, help="送完后等待所有回复的最长时间（秒）")
+    pipeline.add_argument("--no-memory", action="store_true", help="不使用tracemalloc统计内存（吞吐更接近真实）")
+    pipeline.add_argument("--metrics", action="store_true", help="启用指标收集并在结束时输出摘要")
+    baseline = parser.add_argument_group("基线")
+    baseline.add_argument("--save-baseline", metavar="PATH", help="将本次结果保存为基线")
+    baseline.add_argument("--compare", metavar="PATH", help="与基线比较，有退化时以状态码1退出")
+    baseline.add_argument("--threshold", type=float, default=0.1, help="视为退化的变差比例")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    events = generate_traffic(
+        users=args.users,
+        duration=args.duration,
+        bursts_per_user=args.bursts,
+        burst_size=args.burst_size,
+        burst_gap=args.burst_gap,
+        seed=args.seed
+    )
+    llm = FakeLLM(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens,
+        seed=args.seed
+    )
+    return run_cli(args, events, llm)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from benchmarks.pipeline import drive_pipeline
+from benchmarks.traffic import TrafficEvent
+from src.utils.LLMServer.base_llm import BaseLLM
+from src.utils.Metrics import metrics
+
+# 越大越好的指标，其余参与比较的指标越小越好
+HIGHER_IS_BETTER = {"messages_per_s", "replies_per_s"}
+
+# 不影响基准结果的命令行参数，不计入基线的运行参数
+NON_PARAM_ARGS = ("save_baseline", "compare", "threshold", "metrics", "drain_timeout")
+
+# 参与基线比较的指标
+COMPARED_METRICS = [
+    "messages_per_s",
+    "replies_per_s",
+    "latency_p50_ms",
+    "latency_p99_ms",
+    "peak_memory_mb",
+]
+
+
+def save_baseline(path: str, result: Dict[str, Any], params: Dict[str, Any]) -> None:
+    """保存基准结果作为基线
+
+    Args:
+        path (str): 基线文件路径
+        result (Dict[str, Any]): 基准结果
+        params (Dict[str, Any]): 运行参数，比较时用于检查是否一致
+    """
+    file = Path(path)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump({"params": params, "result": result}, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """读取基线文件
+
+    Args:
+        path (str): 基线文件路径
+
+    Returns:
+        Dict[str, Any]: {"params": 运行参数, "result": 基准结果}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_with_baseline(
+    result: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = 0.1
+    ) -> List[Tuple[str, float, float, float, bool]]:
+    """将本次结果与基线比较
+
+    Args:
+        result (Dict[str, Any]): 本次基准结果
+        baseline (Dict[str, Any]): 基线中的基准结果
+        threshold (float): 变差超过该比例视为退化
+
+    Returns:
+        List[Tuple[str, float, float, float, bool]]: [(指标, 基线值, 本次值, 变化比例, 是否退化), ...]
+    """
+    rows = []
+    for name in COMPARED_METRICS:
+        if name not in result or name not in baseline:
+            continue
+        old, new = float(baseline[name]), float(result[name])
+        change = (new - old) / old if old else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    """输出基准结果"""
+    print("基准结果:")
+    for name, value in result.items():
+        print(f"  {name:<18} {value:.3f}" if isinstance(value, float) else f"  {name:<18} {value}")
+
+
+def report_baseline(
+    result: Dict[str, Any],
+    params: Dict[str, Any],
+    compare: Optional[str] = None,
+    save: Optional[str] = None,
+    threshold: float = 0.1
+    ) -> int:
+    """按命令行参数与基线比较和/或保存基线
+
+    Args:
+        result (Dict[str, Any]): 本次基准结果
+        params (Dict[str, Any]): 运行参数
+        compare (Optional[str]): 要比较的基线文件路径
+        save (Optional[str]): 要保存的基线文件路径
+        threshold (float): 变差超过该比例视为退化
+
+    Returns:
+        int: 退出状态码，有退化时为1
+    """
+    exit_code = 0
+    if compare:
+        baseline = load_baseline(compare)
+        if baseline["params"] != params:
+            print("警告: 本次运行参数与基线不同，比较结果可能没有意义")
+        print(f"与基线 {compare} 比较:")
+        for name, old, new, change, regressed in compare_with_baseline(result, baseline["result"], threshold):
+            print(f"  {name:<18} {old:>12.3f} -> {new:>12.3f} ({change:+.1%}){'  退化' if regressed else ''}")
+            if regressed:
+                exit_code = 1
+    if save:
+        save_baseline(save, result, params)
+        print(f"已保存基线到 {save}")
+    return exit_code
+
+
+def run_cli(args: argparse.Namespace, events: List[TrafficEvent], llm: BaseLLM) -> int:
+    """命令行入口的公共部分：运行基准、输出结果，并按参数与基线比较和/或保存基线
+
+    Args:
+        args (argparse.Namespace): 命令行参数，需要包含消息管道和基线的参数
+        events (List[TrafficEvent]): 要送入的消息事件
+        llm (BaseLLM): 回复使用的大模型
+
+    Returns:
+        int: 退出状态码，有退化时为1
+    """
+    params = {key: value for key, value in vars(args).items() if key not in NON_PARAM_ARGS}
+    metrics.enabled = args.metrics
+
+    result = asyncio.run(drive_pipeline(
+        events,
+        llm,
+        time_interval=args.time_interval,
+        speed=args.speed,
+        drain_timeout=args.drain_timeout,
+        trace_memory=not args.no_memory
+    ))
+
+    print_result(result)
+    if args.metrics:
+        print("指标摘要:")
+        print(metrics.summary())
+    return report_baseline(result, params, args.compare, args.save_baseline, args.threshold)
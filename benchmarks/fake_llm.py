@@ -0,0 +1,44 @@
+import asyncio
+import random
+from typing import Optional
+from src.utils.LLMServer.base_llm import BaseLLM
+
+
+class FakeLLM(BaseLLM):
+    """进程内的假大模型，按配置的延迟和token速率返回固定长度的回复"""
+
+    def __init__(self,
+                latency: float = 0.05,
+                latency_jitter: float = 0.02,
+                token_rate: float = 200.0,
+                response_tokens: int = 40,
+                seed: Optional[int] = 0,
+                **kwargs):
+        """
+        初始化假大模型
+
+        Args:
+            latency (float): 首token延迟（单位：秒）
+            latency_jitter (float): 延迟的随机抖动范围（单位：秒）
+            token_rate (float): 生成速率（token/秒），0为瞬间生成
+            response_tokens (int): 每次回复的token数（一个字符算一个token）
+            seed (Optional[int]): 随机种子
+            **kwargs: 传给BaseLLM的参数
+        """
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self._random = random.Random(seed)
+        self.call_count = 0
+
+    async def api_response(self, prompt: str) -> str:
+        """模拟API调用，等待延迟和生成时间后返回回复"""
+        self.call_count += 1
+        delay = max(self.latency + self._random.uniform(-self.latency_jitter, self.latency_jitter), 0)
+        if self.token_rate > 0:
+            delay += self.response_tokens / self.token_rate
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return "喵" * self.response_tokens
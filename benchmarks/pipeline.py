@@ -0,0 +1,127 @@
+import asyncio
+import math
+import threading
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+from benchmarks.traffic import TrafficEvent
+from src.utils.LLMServer.base_llm import BaseLLM
+from src.utils.MessageHandle.IngressGuard import IngressGuard
+from src.utils.MessageHandle.MessageManager import MessageManager
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """计算分位数（最近秩法），没有样本时返回None
+
+    Args:
+        samples (List[float]): 已排序的样本
+        q (float): 分位（0~1）
+    """
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))
+    return samples[index]
+
+
+async def drive_pipeline(
+    events: Iterable[TrafficEvent],
+    llm: BaseLLM,
+    time_interval: float = 0.2,
+    speed: Optional[float] = 1.0,
+    drain_timeout: float = 600.0,
+    trace_memory: bool = True
+    ) -> Dict[str, float]:
+    """把消息事件按时间送入 MessageManager，由注册的处理器调用大模型回复，并统计性能
+
+    回复延迟从用户最后一条消息入队开始计算，到处理器拿到大模型回复为止，包含防抖等待
+
+    Args:
+        events (Iterable[TrafficEvent]): 按时间排序的消息事件
+        llm (BaseLLM): 用于回复的大模型
+        time_interval (float): 消息队列防抖等待时间（单位：秒）
+        speed (Optional[float]): 回放速度倍数，None或0为不等待、尽快送入
+        drain_timeout (float): 送完后等待所有回复完成的最长时间（单位：秒）
+        trace_memory (bool): 是否使用tracemalloc统计内存峰值（会降低吞吐）
+
+    Returns:
+        Dict[str, float]: 统计结果
+    """
+    events = list(events)
+    # 使用默认的入口防护，不读取（也不生成）机器人的配置文件，保证结果可以和基线比较
+    manager = MessageManager(time_interval=time_interval, ingress_guard=IngressGuard())
+    lock = threading.Lock()
+    last_enqueue: Dict[str, float] = {}
+    last_reply: Dict[str, float] = {}
+    latencies: List[float] = []
+
+    @manager.message_processor
+    async def reply_processor(user_id: str, message: str) -> str:
+        with lock:
+            enqueue_time = last_enqueue[user_id]
+        ai_response, _ = await llm.chat(user_id, message)
+        now = time.perf_counter()
+        with lock:
+            latencies.append(now - enqueue_time)
+            last_reply[user_id] = now
+        return ai_response
+
+    if trace_memory:
+        tracemalloc.start()
+    segments = 0
+    start = time.perf_counter()
+    try:
+        for event in events:
+            if speed:
+                delay = start + event.offset / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # 先记录到达时间，处理线程可能在入队后立刻取走消息
+            with lock:
+                previous_enqueue = last_enqueue.get(event.user_id)
+                last_enqueue[event.user_id] = time.perf_counter()
+            duplicates = manager.ingress_guard.stats["duplicates"]
+            await manager.add_private_message(event.message, event.user_id, event.event_id)
+            if manager.ingress_guard.stats["duplicates"] > duplicates:
+                # 重复事件被过滤，不会有回复，恢复之前的到达时间
+                with lock:
+                    if previous_enqueue is None:
+                        del last_enqueue[event.user_id]
+                    else:
+                        last_enqueue[event.user_id] = previous_enqueue
+                continue
+            segments += len(event.message)
+        fed = time.perf_counter()
+
+        # 等待每个用户的最后一条消息都得到回复
+        deadline = fed + drain_timeout
+        while True:
+            with lock:
+                pending = sum(1 for user_id, enqueue_time in last_enqueue.items() if last_reply.get(user_id, 0) < enqueue_time)
+            if not pending or time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    finally:
+        manager.shutdown()
+        if trace_memory:
+            tracemalloc.stop()
+
+    with lock:
+        samples = sorted(latencies)
+    return {
+        "messages": len(events),
+        "duplicates": manager.ingress_guard.stats["duplicates"],
+        "segments": segments,
+        "users": len(last_enqueue),
+        "replies": len(samples),
+        "unanswered_users": pending,
+        "elapsed_s": elapsed,
+        "feed_s": fed - start,
+        "messages_per_s": len(events) / elapsed if elapsed else 0.0,
+        "replies_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "latency_p50_ms": (percentile(samples, 0.5) or 0.0) * 1000,
+        "latency_p99_ms": (percentile(samples, 0.99) or 0.0) * 1000,
+        "latency_max_ms": (samples[-1] if samples else 0.0) * 1000,
+        "peak_memory_mb": peak_memory / (1024 * 1024),
+    }
@@ -0,0 +1,69 @@
+"""
+回放 TrafficRecorder 抓取的真实流量
+
+在项目根目录运行：python -m benchmarks.replay <抓包文件> --speed 10
+"""
+import argparse
+import sys
+from typing import List, Optional
+from benchmarks.baseline import run_cli
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.traffic import TrafficEvent
+from src.utils.MessageHandle.TrafficRecorder import read_capture
+
+
+def load_capture(path: str, max_gap: Optional[float] = None) -> List[TrafficEvent]:
+    """读取抓包文件为消息事件，保留消息之间的到达间隔
+
+    Args:
+        path (str): 抓包文件路径
+        max_gap (Optional[float]): 超过该时长（单位：秒）的空闲间隔会被压缩到该时长，
+            用于跳过夜间等长时间没有消息的时段，None为不压缩
+
+    Returns:
+        List[TrafficEvent]: 按时间排序的消息事件
+    """
+    events: List[TrafficEvent] = []
+    previous = None
+    shifted = 0.0
+    for offset, user_id, message, event_id in read_capture(path):
+        if max_gap is not None and previous is not None and offset - previous > max_gap:
+            shifted += offset - previous - max_gap
+        previous = offset
+        events.append(TrafficEvent(offset - shifted, user_id, message, event_id))
+    events.sort(key=lambda event: event.offset)
+    return events
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay", description="按原始时间间隔回放抓包流量")
+    parser.add_argument("capture", help="TrafficRecorder 写出的抓包文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0为尽快回放")
+    parser.add_argument("--max-gap", type=float, default=None, help="把超过该时长（秒）的空闲间隔压缩到该时长")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟api_response的延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="模拟生成速率（token/秒），0为瞬间生成")
+    parser.add_argument("--response-tokens", type=int, default=40, help="每次回复的token数")
+    parser.add_argument("--time-interval", type=float, default=5.0, help="消息队列防抖等待时间（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=600.0, help="送完后等待所有回复的最长时间（秒）")
+    parser.add_argument("--no-memory", action="store_true", help="不使用tracemalloc统计内存")
+    parser.add_argument("--metrics", action="store_true", help="启用指标收集并在结束时输出摘要")
+    parser.add_argument("--save-baseline", metavar="PATH", help="将本次结果保存为基线")
+    parser.add_argument("--compare", metavar="PATH", help="与基线比较，有退化时以状态码1退出")
+    parser.add_argument("--threshold", type=float, default=0.1, help="视为退化的变差比例")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    events = load_capture(args.capture, args.max_gap)
+    llm = FakeLLM(
+        latency=args.latency,
+        latency_jitter=0.0,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens
+    )
+    return run_cli(args, events, llm)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
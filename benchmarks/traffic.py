@@ -0,0 +1,116 @@
+import random
+from typing import List, NamedTuple, Optional
+from nonebot.adapters.onebot.v11 import Message, MessageSegment
+
+# 合成文本使用的词表
+_WORDS = [
+    "你好", "在吗", "今天", "好累", "吃饭了吗", "哈哈哈", "晚安", "早上好",
+    "我想你了", "在干嘛", "好无聊", "下雨了", "明天见", "真的吗", "好耶", "呜呜",
+]
+
+# (表情id, 表情文本)
+_FACES = [("14", "[微笑]"), ("5", "[流泪]"), ("13", "[呲牙]"), ("178", "[斜眼笑]"), ("66", "[爱心]")]
+
+
+class TrafficEvent(NamedTuple):
+    """一条入站的私聊消息事件"""
+    # 距离流量开始的时间（单位：秒）
+    offset: float
+    user_id: str
+    message: Message
+    # 适配器事件id，用于重复事件过滤，合成流量中为None
+    event_id: Optional[str] = None
+
+
+def text_segment(rng: random.Random) -> MessageSegment:
+    """生成一个文本消息段"""
+    return MessageSegment.text("".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 6))))
+
+
+def face_segment(rng: random.Random) -> MessageSegment:
+    """生成一个QQ黄脸表情消息段（带NapCat格式的raw数据）"""
+    face_id, face_text = rng.choice(_FACES)
+    raw = {"faceIndex": int(face_id), "faceText": face_text, "faceType": 1}
+    return MessageSegment("face", {"id": face_id, "raw": str(raw)})
+
+
+def image_segment(rng: random.Random, animation: bool = False) -> MessageSegment:
+    """生成一个图片（或动画表情）消息段"""
+    file = f"{rng.getrandbits(64):016x}.image"
+    data = {"file": file, "url": f"https://multimedia.nt.qq.com.cn/download?fileid={file}"}
+    data["summary"] = "[动画表情]" if animation else ""
+    return MessageSegment("image", data)
+
+
+def random_message(rng: random.Random) -> Message:
+    """按大致的真实比例生成一条消息：大部分是文本，其次是表情、图片和多段消息"""
+    roll = rng.random()
+    if roll < 0.6:
+        return Message(text_segment(rng))
+    if roll < 0.72:
+        return Message(face_segment(rng))
+    if roll < 0.8:
+        return Message(image_segment(rng))
+    if roll < 0.88:
+        return Message(image_segment(rng, animation=True))
+    # 多段消息：文本夹杂表情和图片
+    message = Message()
+    for _ in range(rng.randint(2, 5)):
+        kind = rng.random()
+        if kind < 0.6:
+            message.append(text_segment(rng))
+        elif kind < 0.85:
+            message.append(face_segment(rng))
+        else:
+            message.append(image_segment(rng))
+    return message
+
+
+def generate_traffic(
+    users: int = 1000,
+    duration: float = 10.0,
+    bursts_per_user: float = 1.5,
+    burst_size: int = 4,
+    burst_gap: float = 0.3,
+    seed: Optional[int] = 0
+    ) -> List[TrafficEvent]:
+    """生成合成的私聊消息流
+
+    每个用户在持续时间内随机发起若干次“连发”（连续打几句话），
+    连发内的消息间隔较短，用于触发消息队列的防抖合并
+
+    Args:
+        users (int): 模拟的用户数
+        duration (float): 流量持续时间（单位：秒）
+        bursts_per_user (float): 每个用户的平均连发次数
+        burst_size (int): 每次连发的平均消息条数
+        burst_gap (float): 连发内消息的平均间隔（单位：秒）
+        seed (Optional[int]): 随机种子，相同的种子生成相同的流量
+
+    Returns:
+        List[TrafficEvent]: 按时间排序的消息事件
+    """
+    rng = random.Random(seed)
+    events: List[TrafficEvent] = []
+    for index in range(users):
+        user_id = str(10000000 + index)
+        # 泊松分布的连发次数，至少一次
+        bursts = max(1, _poisson(rng, bursts_per_user))
+        for _ in range(bursts):
+            offset = rng.uniform(0, duration)
+            for _ in range(max(1, _poisson(rng, burst_size))):
+                events.append(TrafficEvent(offset, user_id, random_message(rng)))
+                offset += rng.expovariate(1 / burst_gap) if burst_gap > 0 else 0
+    events.sort(key=lambda event: event.offset)
+    return events
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """生成泊松分布随机数（Knuth算法，均值较小时足够快）"""
+    threshold = 2.718281828459045 ** -mean
+    count = 0
+    product = rng.random()
+    while product > threshold:
+        count += 1
+        product *= rng.random()
+    return count
@@ -0,0 +1,32 @@
+from nonebot import get_app, get_driver
+from nonebot.log import logger
+from src.utils.Config import ConfigManager
+from src.utils.Metrics import metrics
+
+config = ConfigManager(template_path="./src/utils/Config/template.toml")
+metrics_settings = config.get("metrics_settings", {})
+metrics.enabled = metrics_settings.get("enable_metrics", False)
+
+driver = get_driver()
+
+if metrics.enabled and metrics_settings.get("enable_prometheus_endpoint", False):
+    try:
+        from fastapi.responses import PlainTextResponse
+
+        app = get_app()
+
+        @app.get(metrics_settings.get("prometheus_endpoint_path", "/metrics"), response_class=PlainTextResponse)
+        # 导出Prometheus文本格式的指标
+        async def prometheus_metrics():
+            return metrics.render_prometheus()
+    except Exception as e:
+        logger.warning(f"Prometheus指标接口注册失败（需要FastAPI驱动器）: {e}")
+
+if metrics.enabled and metrics_settings.get("log_dump_interval", 0) > 0:
+    @driver.on_startup
+    async def start_metrics_log_dump():
+        metrics.start_log_dump(metrics_settings["log_dump_interval"])
+
+    @driver.on_shutdown
+    async def stop_metrics_log_dump():
+        metrics.stop_log_dump()
@@ -0,0 +1,56 @@
+from datetime import datetime
+from pathlib import Path
+from nonebot import on_command
+from nonebot.adapters.onebot.v11 import Event, Message
+from nonebot.params import CommandArg
+from src.utils.Config import ConfigManager
+from src.utils.Tracing import tracer
+from src.utils.Tracing.SamplingProfiler import profile_for
+
+config = ConfigManager(template_path="./src/utils/Config/template.toml")
+tracing_settings = config.get("tracing_settings", {})
+tracer.enabled = tracing_settings.get("enable_tracing", False)
+tracer.slow_threshold = tracing_settings.get("slow_trace_threshold", 15)
+tracer.set_buffer_size(tracing_settings.get("slow_trace_buffer_size", 50))
+
+# 采样时长上限（单位：秒）
+MAX_PROFILE_SECONDS = 300
+
+
+async def _is_master(event: Event) -> bool:
+    """只响应主人的命令"""
+    master_qq = config.get("chat_settings", {}).get("private_chat", {}).get("master_qq")
+    return event.get_user_id() == str(master_qq)
+
+profile = on_command("profile", rule=_is_master, priority=5, block=True)
+slow_traces = on_command("slow_traces", rule=_is_master, priority=5, block=True)
+
+
+@profile.handle()
+# 采样分析事件循环，输出可以生成火焰图的折叠栈文件
+async def handle_profile(args: Message = CommandArg()):
+    arg = args.extract_plain_text().strip()
+    seconds = float(arg) if arg.replace(".", "", 1).isdigit() else 10
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    await profile.send(f"开始采样 {seconds:g} 秒")
+
+    folded = await profile_for(seconds)
+    output_dir = Path(tracing_settings.get("profile_output_dir", "./data/profile"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(folded)
+    await profile.finish(f"采样完成，折叠栈已保存到 {output_path}")
+
+
+@slow_traces.handle()
+# 查看最近的慢对话追踪
+async def handle_slow_traces(args: Message = CommandArg()):
+    if not tracer.enabled:
+        await slow_traces.finish("追踪未启用")
+    arg = args.extract_plain_text().strip()
+    count = int(arg) if arg.isdigit() else 3
+    traces = tracer.get_slow_traces()[-count:]
+    if not traces:
+        await slow_traces.finish("暂无慢对话追踪")
+    await slow_traces.finish("\n\n".join(trace.format() for trace in reversed(traces)))
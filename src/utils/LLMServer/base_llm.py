@@ -3,9 +3,15 @@ import asyncio
 import uuid
 import time
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.process import BaseProcess
 from datetime import datetime
-from typing import Dict, List, Tuple, Callable, Optional, Any, Set
+from typing import AsyncIterator, Dict, List, Tuple, Callable, Optional, Any, Set
 from src.utils.Bases.ScopeBase import ScopeBase
+from src.utils.Metrics import metrics
+from src.utils.Tracing import tracer
 
 class ConversationRecord:
     """对话记录类，记录单次对话的信息"""
@@ -44,6 +50,8 @@ class UserContext:
         self.history: List[Tuple[str, str]] = []  # [(用户问题, AI回答), ...]
         self.max_pairs = max_pairs
         self.conversation_records: Dict[str, ConversationRecord] = {}
+        # 已经写入归档的记录数，记录按完成顺序加入，前这么多条已归档
+        self.archived_count = 0
     
     def add_pair(self, user_message: str, ai_message: str, record: ConversationRecord) -> List[Tuple[str, str]]:
         """添加一对对话，并返回被移除的对话对（如果有）"""
@@ -76,6 +84,50 @@ class UserContext:
         """清空历史对话"""
         self.history = []
         self.conversation_records = {}
+        self.archived_count = 0
+
+def _search_records_partition(
+    pattern: str,
+    partition: List[Tuple[str, List[Tuple[str, str, str]]]],
+    limit: Optional[int] = None
+    ) -> List[Tuple[str, List[str]]]:
+    """
+    在子进程中搜索一个用户分片的对话记录快照
+    
+    Args:
+        pattern (str): 正则表达式模式
+        partition (List[Tuple[str, List[Tuple[str, str, str]]]]): [(用户ID, [(记录ID, 提示词, AI回复), ...]), ...]
+        limit (Optional[int]): 本分片最多返回的匹配条数，None为不限制
+    
+    Returns:
+        List[Tuple[str, List[str]]]: [(用户ID, [匹配的记录ID, ...]), ...]
+    """
+    regex = re.compile(pattern)
+    result = []
+    found = 0
+    
+    for user_id, records in partition:
+        matched = []
+        for record_id, chat_prompt, ai_response in records:
+            if regex.search(chat_prompt) or regex.search(ai_response):
+                matched.append(record_id)
+                found += 1
+                if limit is not None and found >= limit:
+                    break
+        if matched:
+            result.append((user_id, matched))
+        if limit is not None and found >= limit:
+            break
+    
+    return result
+
+def _join_processes(processes: List[BaseProcess]):
+    """等待已经结束的子进程退出"""
+    for process in processes:
+        process.join()
+
+class ConversationSearchError(RuntimeError):
+    """跨用户搜索失败（例如进程池被其他超时的搜索结束）"""
 
 class BaseLLM(ScopeBase, ABC):
     """LLM基类，管理上下文和对话历史"""
@@ -118,6 +170,8 @@ class BaseLLM(ScopeBase, ABC):
         self.max_pairs = max_pairs
         self.user_contexts: Dict[str, UserContext] = {}
         self._hook_functions: Set[Callable] = set()
+        # 跨用户搜索使用的进程池，首次搜索时创建
+        self._search_executor: Optional[ProcessPoolExecutor] = None
         
         # 保存API参数
         self.url = url
@@ -217,26 +271,40 @@ class BaseLLM(ScopeBase, ABC):
         Returns:
             Tuple[str, str]: (AI回复, 对话记录ID)
         """
-        chat_prompt = self._format_chat_prompt(user_id, message)
-        
-        # 创建对话记录
-        record = ConversationRecord(user_id, chat_prompt)
-        
-        # 调用API生成回复
-        ai_response = await self.api_response(chat_prompt)
-        
-        # 完成对话记录
-        record.complete(ai_response)
-        
-        # 如果启用上下文管理，更新用户上下文
-        if self.enable_context:
-            user_context = self._get_user_context(user_id)
-            removed_pairs = user_context.add_pair(message, ai_response, record)
+        with tracer.trace("chat", user_id=user_id):
+            with tracer.span("_format_chat_prompt"):
+                chat_prompt = self._format_chat_prompt(user_id, message)
+        
+            # 创建对话记录
+            record = ConversationRecord(user_id, chat_prompt)
+            # 追踪ID沿用这一轮的第一条对话记录ID
+            tracer.bind_record(record.id)
+        
+            # 调用API生成回复
+            api_start = time.perf_counter()
+            with tracer.span("api_response", model=self.model, record_id=record.id):
+                ai_response = await self.api_response(chat_prompt)
+            if metrics.enabled:
+                api_duration = time.perf_counter() - api_start
+                tokens = self.count_tokens(ai_response)
+                metrics.observe("api_response_seconds", api_duration, model=self.model)
+                metrics.inc("api_response_tokens_total", tokens, model=self.model)
+                if api_duration > 0:
+                    metrics.observe("api_response_tokens_per_second", tokens / api_duration, model=self.model)
+        
+            # 完成对话记录
+            record.complete(ai_response)
+        
+            # 如果启用上下文管理，更新用户上下文
+            if self.enable_context:
+                user_context = self._get_user_context(user_id)
+                removed_pairs = user_context.add_pair(message, ai_response, record)
             
-            # 如有对话被移除，运行钩子函数
-            await self._run_hooks(user_id, removed_pairs, record.id)
+                # 如有对话被移除，运行钩子函数
+                with metrics.timer("run_hooks_seconds"), tracer.span("_run_hooks", removed=len(removed_pairs)):
+                    await self._run_hooks(user_id, removed_pairs, record.id)
         
-        return ai_response, record.id
+            return ai_response, record.id
     
     @abstractmethod
     async def api_response(self, prompt: str) -> str:
@@ -251,6 +319,19 @@ class BaseLLM(ScopeBase, ABC):
         """
         pass
     
+    def count_tokens(self, text: str) -> int:
+        """
+        估算文本的token数，用于统计吞吐
+        默认按字符数估算，子类可以根据API返回的实际用量重写
+        
+        Args:
+            text (str): 文本
+        
+        Returns:
+            int: token数
+        """
+        return len(text)
+    
     def get_conversation_record(self, user_id: str, record_id: str) -> Optional[ConversationRecord]:
         """
         获取对话记录
@@ -312,6 +393,175 @@ class BaseLLM(ScopeBase, ABC):
         
         return result
     
+    def _get_search_executor(self, max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        获取跨用户搜索使用的进程池，如果不存在则创建
+        
+        Args:
+            max_workers (Optional[int]): 进程数，None则使用CPU核心数
+        
+        Returns:
+            ProcessPoolExecutor: 进程池
+        """
+        if self._search_executor is None:
+            # 进程里已经运行着消息队列和指标等线程，fork不安全，使用spawn启动子进程
+            self._search_executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._search_executor
+    
+    def _kill_search_executor(self) -> List[BaseProcess]:
+        """
+        结束进程池的子进程并丢弃进程池，不等待子进程退出
+        
+        Returns:
+            List[BaseProcess]: 被结束的子进程，需要调用方join
+        """
+        executor = self._search_executor
+        if executor is None:
+            return []
+        self._search_executor = None
+        # _processes 是 ProcessPoolExecutor 的内部属性，标准库没有提供结束子进程的公开接口
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        for process in processes:
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return processes
+    
+    def shutdown_search_executor(self):
+        """
+        关闭跨用户搜索使用的进程池
+        正在执行的搜索（例如回溯失控的正则）无法中断，所以直接结束子进程，下次搜索时重新创建进程池
+        """
+        _join_processes(self._kill_search_executor())
+    
+    async def search_all_user_conversations_async(
+        self,
+        pattern: str,
+        batch_size: int = 64,
+        timeout: Optional[float] = 30.0,
+        limit: Optional[int] = None,
+        max_workers: Optional[int] = None
+        ) -> AsyncIterator[Dict[str, List[ConversationRecord]]]:
+        """
+        非阻塞地搜索所有用户的对话记录
+        
+        先对当前的对话记录做快照，再按用户分片交给进程池搜索，
+        每个分片完成后立即以批次的形式返回，搜索期间事件循环可以继续处理消息
+        
+        Args:
+            pattern (str): 正则表达式模式
+            batch_size (int): 每个分片（批次）包含的用户数
+            timeout (Optional[float]): 整个查询的超时时间（单位：秒），None为不限制
+            limit (Optional[int]): 最多返回的匹配记录数，None为不限制
+            max_workers (Optional[int]): 进程池进程数，仅在首次创建进程池时生效
+        
+        Yields:
+            Dict[str, List[ConversationRecord]]: 按用户ID组织的一批匹配记录
+        
+        Raises:
+            asyncio.TimeoutError: 查询超过timeout仍未完成（已返回的批次仍然有效）
+            ConversationSearchError: 进程池在搜索期间被结束或损坏
+        
+        达到上限或调用方停止迭代时只取消还没开始的分片，已经开始的分片受limit限制会自行结束；
+        超时时如果还有分片在执行，会结束整个进程池的子进程，
+        同时进行中的其他跨用户搜索会因此抛出ConversationSearchError
+        """
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            print(f"正则表达式搜索异常: {e}")
+            return
+        
+        if limit is not None and limit <= 0:
+            return
+        
+        # 对话记录快照，避免搜索期间记录被修改
+        snapshot: Dict[str, Dict[str, ConversationRecord]] = {
+            user_id: dict(user_context.get_all_conversation_records())
+            for user_id, user_context in list(self.user_contexts.items())
+        }
+        
+        # 按用户分片，只把可序列化的字符串传给子进程
+        partitions = []
+        current = []
+        for user_id, records in snapshot.items():
+            if not records:
+                continue
+            current.append((
+                user_id,
+                [(record_id, record.chat_prompt, record.ai_response) for record_id, record in records.items()]
+            ))
+            if len(current) >= batch_size:
+                partitions.append(current)
+                current = []
+        if current:
+            partitions.append(current)
+        
+        if not partitions:
+            return
+        
+        loop = asyncio.get_running_loop()
+        executor = self._get_search_executor(max_workers)
+        try:
+            futures = [
+                asyncio.wrap_future(executor.submit(_search_records_partition, pattern, partition, limit))
+                for partition in partitions
+            ]
+        except BrokenProcessPool as e:
+            self._kill_search_executor()
+            raise ConversationSearchError(f"跨用户搜索的进程池已损坏: {e}") from e
+        deadline = loop.time() + timeout if timeout is not None else None
+        remaining = limit
+        timed_out = False
+        
+        try:
+            pending = set(futures)
+            while pending:
+                wait_timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                done, pending = await asyncio.wait(
+                    pending, 
+                    timeout=wait_timeout, 
+                    return_when=asyncio.FIRST_COMPLETED
+                    )
+                if not done:
+                    timed_out = True
+                    raise asyncio.TimeoutError(f"跨用户搜索超时（{timeout}秒）")
+                
+                for future in done:
+                    # 进程池被其他超时的搜索结束时，排队中的分片被取消，执行中的分片抛出BrokenProcessPool
+                    try:
+                        partition_result = future.result()
+                    except (asyncio.CancelledError, BrokenProcessPool) as e:
+                        raise ConversationSearchError("跨用户搜索的进程池在搜索期间被结束") from e
+                    
+                    batch: Dict[str, List[ConversationRecord]] = {}
+                    for user_id, record_ids in partition_result:
+                        matches = [snapshot[user_id][record_id] for record_id in record_ids]
+                        if remaining is not None:
+                            matches = matches[:remaining]
+                            remaining -= len(matches)
+                        if matches:
+                            batch[user_id] = matches
+                        if remaining == 0:
+                            break
+                    
+                    if batch:
+                        yield batch
+                    if remaining == 0:
+                        return
+        finally:
+            # 提前结束（超时、达到上限或调用方停止迭代）时只取消还没开始的分片，
+            # 已经开始的分片受limit限制会自行结束，让它们执行完，不影响共用进程池的其他搜索
+            # （取消asyncio的future会同时取消进程池中还在排队的future，正在执行的不受影响）
+            for future in futures:
+                future.cancel()
+            # 超时说明有分片失控（例如回溯失控的正则），结束子进程，避免继续占用进程池
+            if timed_out and self._search_executor is executor:
+                processes = self._kill_search_executor()
+                await loop.run_in_executor(None, _join_processes, processes)
+    
     def clear_user_context(self, user_id: str):
         """
         清空用户上下文
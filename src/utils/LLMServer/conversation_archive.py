@@ -0,0 +1,471 @@
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import uuid
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Sequence, Tuple
+from src.utils.LLMServer.base_llm import BaseLLM, ConversationRecord
+
+# 文件头：魔数 + 版本，补齐到8字节
+FILE_MAGIC = b"KCAR"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<4sI")
+# 块头：魔数、行数、元数据长度、数据长度
+CHUNK_MAGIC = b"KCAC"
+CHUNK_HEADER = struct.Struct("<4sIIQ")
+
+# 列名和数组类型（q: int64, I: uint32, B: 字节）
+COLUMN_TYPES: Dict[str, str] = {
+    "id": "B",
+    "user": "I",
+    "start_us": "q",
+    "duration_us": "q",
+    "prompt": "I",
+    "response": "I",
+    "user_offsets": "q",
+    "user_blob": "B",
+    "string_offsets": "q",
+    "string_blob": "B",
+}
+
+# 导出时的字段，与ConversationRecord.to_dict一致
+EXPORT_FIELDS = ["id", "user_id", "chat_prompt", "ai_response", "start_time", "end_time", "duration"]
+
+_NEED_BYTESWAP = sys.byteorder != "little"
+
+
+def _to_us(value: datetime) -> int:
+    """datetime转换为微秒时间戳"""
+    return int(round(value.timestamp() * 1_000_000))
+
+
+def _from_us(value: int) -> datetime:
+    """微秒时间戳转换为datetime"""
+    return datetime.fromtimestamp(value / 1_000_000)
+
+
+def _pad(length: int) -> int:
+    """补齐到8字节需要的长度"""
+    return -length % 8
+
+
+def _encode_table(values: List[str]) -> Tuple[array, bytes]:
+    """把字符串表编码为偏移量数组和utf-8数据"""
+    offsets = array("q", [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+class ConversationArchiveWriter:
+    """
+    对话记录列式归档写入器
+    记录按块追加写入文件，每块内按列存储：用户id和重复的字符串使用字典编码，时间和耗时为整数微秒
+    """
+
+    def __init__(self, path: str, chunk_size: int = 4096):
+        """初始化写入器
+
+        Args:
+            path (str): 归档文件路径，已存在时追加
+            chunk_size (int, optional): 每块的记录数
+        """
+        self._path = Path(path)
+        self._chunk_size = chunk_size
+        self._rows: List[ConversationRecord] = []
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        if self._path.exists():
+            self._truncate_torn_tail()
+        self._file = open(self._path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+
+    def _truncate_torn_tail(self):
+        """检查已有的归档文件，把没有写完整的最后一块截掉，避免新块接在残缺数据后面"""
+        size = self._path.stat().st_size
+        with open(self._path, "rb") as f:
+            header = f.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size:
+                # 连文件头都没有写完整，重新开始
+                end = 0
+            else:
+                magic, version = FILE_HEADER.unpack(header)
+                if magic != FILE_MAGIC or version != FILE_VERSION:
+                    raise ValueError(f"不是支持的对话归档文件: {self._path}")
+                end = FILE_HEADER.size
+                while True:
+                    chunk_header = f.read(CHUNK_HEADER.size)
+                    if len(chunk_header) < CHUNK_HEADER.size:
+                        break
+                    magic, rows, meta_len, data_len = CHUNK_HEADER.unpack(chunk_header)
+                    if magic != CHUNK_MAGIC:
+                        raise ValueError(f"对话归档文件已损坏（偏移 {end}）")
+                    chunk_end = end + CHUNK_HEADER.size + meta_len + data_len
+                    if chunk_end > size:
+                        break
+                    end = chunk_end
+                    f.seek(end)
+        if end < size:
+            os.truncate(self._path, end)
+
+    def add(self, record: ConversationRecord):
+        """添加一条已完成的对话记录
+
+        Args:
+            record (ConversationRecord): 对话记录
+        """
+        if record.end_time is None:
+            raise ValueError(f"对话记录尚未完成: {record.id}")
+        self._rows.append(record)
+        if len(self._rows) >= self._chunk_size:
+            self.flush()
+
+    def add_all(self, records: Iterable[ConversationRecord]) -> int:
+        """添加多条对话记录，跳过尚未完成的记录
+
+        Args:
+            records (Iterable[ConversationRecord]): 对话记录
+
+        Returns:
+            int: 添加的记录数
+        """
+        count = 0
+        for record in records:
+            if record.end_time is None:
+                continue
+            self.add(record)
+            count += 1
+        return count
+
+    def flush(self):
+        """把缓冲的记录写为一个块"""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+
+        users: Dict[str, int] = {}
+        strings: Dict[str, int] = {}
+        columns: Dict[str, Any] = {
+            "id": bytearray(),
+            "user": array("I"),
+            "start_us": array("q"),
+            "duration_us": array("q"),
+            "prompt": array("I"),
+            "response": array("I"),
+        }
+        for record in rows:
+            columns["id"] += uuid.UUID(record.id).bytes
+            columns["user"].append(users.setdefault(record.user_id, len(users)))
+            columns["start_us"].append(_to_us(record.start_time))
+            columns["duration_us"].append(_to_us(record.end_time) - _to_us(record.start_time))
+            columns["prompt"].append(strings.setdefault(record.chat_prompt, len(strings)))
+            columns["response"].append(strings.setdefault(record.ai_response, len(strings)))
+        columns["user_offsets"], columns["user_blob"] = _encode_table(list(users))
+        columns["string_offsets"], columns["string_blob"] = _encode_table(list(strings))
+        # 记录块内的时间范围，范围扫描时可以跳过整块
+        meta: Dict[str, Any] = {
+            "min_start_us": min(columns["start_us"]),
+            "max_start_us": max(columns["start_us"]),
+        }
+
+        # 数据区：每列补齐到8字节，记录偏移和长度
+        data = bytearray()
+        layout: Dict[str, Tuple[int, int]] = {}
+        for name in COLUMN_TYPES:
+            column = columns[name]
+            if isinstance(column, array):
+                if _NEED_BYTESWAP:
+                    column.byteswap()
+                column = column.tobytes()
+            layout[name] = (len(data), len(column))
+            data += column
+            data += b"\0" * _pad(len(data))
+
+        meta["columns"] = layout
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        meta_bytes += b" " * _pad(CHUNK_HEADER.size + len(meta_bytes))
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(rows), len(meta_bytes), len(data)))
+        self._file.write(meta_bytes)
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self):
+        """写入剩余记录并关闭文件"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "ConversationArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+class _Chunk:
+    """归档中的一个块，列为内存映射上的只读视图"""
+
+    def __init__(self, buffer: memoryview, rows: int, meta: Dict[str, Any]):
+        self.rows = rows
+        self.min_start_us: int = meta["min_start_us"]
+        self.max_start_us: int = meta["max_start_us"]
+        self._columns: Dict[str, Any] = {}
+        for name, (offset, length) in meta["columns"].items():
+            view = buffer[offset:offset + length]
+            typecode = COLUMN_TYPES[name]
+            if typecode == "B":
+                self._columns[name] = view
+            elif _NEED_BYTESWAP:
+                column = array(typecode, view.tobytes())
+                column.byteswap()
+                self._columns[name] = column
+            else:
+                self._columns[name] = view.cast(typecode)
+        # 用户表很小，打开时直接解码
+        self.users: List[str] = self._decode_table("user_offsets", "user_blob")
+
+    def column(self, name: str) -> Sequence[int]:
+        """获取一列（不复制数据）"""
+        return self._columns[name]
+
+    def _decode_table(self, offsets_name: str, blob_name: str) -> List[str]:
+        offsets = self._columns[offsets_name]
+        blob = self._columns[blob_name]
+        return [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def string(self, index: int) -> str:
+        """按需解码字符串表中的一项"""
+        offsets = self._columns["string_offsets"]
+        return bytes(self._columns["string_blob"][offsets[index]:offsets[index + 1]]).decode("utf-8")
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """解码一行，格式与ConversationRecord.to_dict一致"""
+        start_us = self._columns["start_us"][index]
+        duration_us = self._columns["duration_us"][index]
+        return {
+            "id": str(uuid.UUID(bytes=bytes(self._columns["id"][index * 16:index * 16 + 16]))),
+            "user_id": self.users[self._columns["user"][index]],
+            "chat_prompt": self.string(self._columns["prompt"][index]),
+            "ai_response": self.string(self._columns["response"][index]),
+            "start_time": _from_us(start_us).isoformat(),
+            "end_time": _from_us(start_us + duration_us).isoformat(),
+            "duration": duration_us / 1_000_000,
+        }
+
+    def release(self):
+        """释放对内存映射的引用"""
+        for column in self._columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._columns.clear()
+
+
+class ConversationArchive:
+    """
+    对话记录列式归档读取器
+    文件以内存映射方式打开，聚合查询直接扫描整数列，只在需要时解码单行
+    """
+
+    def __init__(self, path: str):
+        """打开归档文件
+
+        Args:
+            path (str): 归档文件路径
+        """
+        self._file = open(path, "rb")
+        self._chunks: List[_Chunk] = []
+        self._mmap: Optional[mmap.mmap] = None
+        self._buffer: Optional[memoryview] = None
+        size = self._file.seek(0, 2)
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"不是支持的对话归档文件: {path}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        magic, version = FILE_HEADER.unpack_from(self._buffer, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            self.close()
+            raise ValueError(f"不是支持的对话归档文件: {path}")
+
+        position = FILE_HEADER.size
+        while position + CHUNK_HEADER.size <= size:
+            magic, rows, meta_len, data_len = CHUNK_HEADER.unpack_from(self._buffer, position)
+            if magic != CHUNK_MAGIC:
+                self.close()
+                raise ValueError(f"对话归档文件已损坏（偏移 {position}）")
+            meta_start = position + CHUNK_HEADER.size
+            data_start = meta_start + meta_len
+            if data_start + data_len > size:
+                # 最后一块没有写完整（例如写入时进程退出），忽略
+                break
+            meta = json.loads(bytes(self._buffer[meta_start:data_start]))
+            self._chunks.append(_Chunk(self._buffer[data_start:data_start + data_len], rows, meta))
+            position = data_start + data_len
+
+    def __len__(self) -> int:
+        return sum(chunk.rows for chunk in self._chunks)
+
+    def turn_counts(self) -> Dict[str, int]:
+        """统计每个用户的对话轮数
+
+        Returns:
+            Dict[str, int]: 用户id到对话轮数
+        """
+        result: Counter = Counter()
+        for chunk in self._chunks:
+            for user_index, count in Counter(chunk.column("user")).items():
+                result[chunk.users[user_index]] += count
+        return dict(result)
+
+    def latency_percentiles(
+        self,
+        percentiles: Sequence[float] = (0.5, 0.9, 0.99),
+        user_id: Optional[str] = None
+        ) -> Dict[float, Optional[float]]:
+        """统计对话耗时的分位数
+
+        Args:
+            percentiles (Sequence[float], optional): 分位（0~1）
+            user_id (Optional[str], optional): 只统计该用户，None为所有用户
+
+        Returns:
+            Dict[float, Optional[float]]: 分位到耗时（单位：秒），没有记录时为None
+        """
+        durations = array("q")
+        for chunk in self._chunks:
+            if user_id is None:
+                durations.extend(chunk.column("duration_us"))
+                continue
+            if user_id not in chunk.users:
+                continue
+            user_index = chunk.users.index(user_id)
+            users = chunk.column("user")
+            column = chunk.column("duration_us")
+            durations.extend(column[i] for i in range(chunk.rows) if users[i] == user_index)
+
+        ordered = sorted(durations)
+        result: Dict[float, Optional[float]] = {}
+        for q in percentiles:
+            if not ordered:
+                result[q] = None
+                continue
+            index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+            result[q] = ordered[index] / 1_000_000
+        return result
+
+    def scan(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """按开始时间范围扫描记录，不在范围内的块直接跳过
+
+        Args:
+            start (Optional[datetime], optional): 开始时间（包含），None为不限制
+            end (Optional[datetime], optional): 结束时间（不包含），None为不限制
+
+        Yields:
+            Dict[str, Any]: 记录，格式与ConversationRecord.to_dict一致
+        """
+        start_us = _to_us(start) if start is not None else None
+        end_us = _to_us(end) if end is not None else None
+        for chunk in self._chunks:
+            if start_us is not None and chunk.max_start_us < start_us:
+                continue
+            if end_us is not None and chunk.min_start_us >= end_us:
+                continue
+            column = chunk.column("start_us")
+            for index in range(chunk.rows):
+                value = column[index]
+                if (start_us is None or value >= start_us) and (end_us is None or value < end_us):
+                    yield chunk.row(index)
+
+    def export_jsonl(self, fp: IO[str], start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """流式导出为JSON Lines
+
+        Args:
+            fp (IO[str]): 输出的文本文件
+            start (Optional[datetime], optional): 开始时间（包含）
+            end (Optional[datetime], optional): 结束时间（不包含）
+
+        Returns:
+            int: 导出的记录数
+        """
+        count = 0
+        for row in self.scan(start, end):
+            fp.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+
+    def export_csv(self, fp: IO[str], start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """流式导出为CSV（fp需要以newline=''打开）
+
+        Args:
+            fp (IO[str]): 输出的文本文件
+            start (Optional[datetime], optional): 开始时间（包含）
+            end (Optional[datetime], optional): 结束时间（不包含）
+
+        Returns:
+            int: 导出的记录数
+        """
+        writer = csv.DictWriter(fp, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        count = 0
+        for row in self.scan(start, end):
+            writer.writerow(row)
+            count += 1
+        return count
+
+    def close(self):
+        """关闭内存映射和文件"""
+        for chunk in self._chunks:
+            chunk.release()
+        self._chunks = []
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> "ConversationArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+def archive_conversations(llm: BaseLLM, path: str, chunk_size: int = 4096) -> int:
+    """把大模型中所有用户尚未归档的对话记录追加写入归档
+    每个用户上下文记录已归档的条数，重复调用只会写入新完成的记录
+
+    Args:
+        llm (BaseLLM): 大模型
+        path (str): 归档文件路径
+        chunk_size (int, optional): 每块的记录数
+
+    Returns:
+        int: 写入的记录数
+    """
+    count = 0
+    archived = []
+    with ConversationArchiveWriter(path, chunk_size) as writer:
+        for user_context in list(llm.user_contexts.values()):
+            records = list(islice(user_context.get_all_conversation_records().values(), user_context.archived_count, None))
+            writer.add_all(records)
+            archived.append((user_context, len(records)))
+            count += len(records)
+    # 全部写入成功后再更新已归档条数
+    for user_context, archived_records in archived:
+        user_context.archived_count += archived_records
+    return count
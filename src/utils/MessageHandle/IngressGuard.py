@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from src.utils.MessageHandle.KMessage import KMessage
+from src.utils.MessageHandle.MessageId import MessageId
+from src.utils.MessageHandle.MessageType import MessageType
+from src.utils.MessageHandle.OverflowPolicy import OverflowPolicy
+from src.utils.Metrics import metrics
+
+# 连续重复时会被合并计数的消息类型
+COLLAPSIBLE_MESSAGE_TYPES = {MessageType.FACE, MessageType.ANIMATION_FACE, MessageType.IMAGE}
+
+
+class IngressGuard:
+    """
+    私聊消息入口防护
+    限制每个用户的消息队列长度，过滤重复的适配器事件，并合并连续重复的表情
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 50,
+        overflow_policy: OverflowPolicy = OverflowPolicy.MERGE,
+        merge_max_length: int = 2000,
+        dedup_size: int = 1024,
+        collapse_repeats: bool = True,
+        reject_notice: str = "消息太多啦，等我回复完再发吧"
+        ):
+        """初始化入口防护
+
+        Args:
+            max_queue_size (int, optional): 每个用户队列的最大消息段数量
+            overflow_policy (OverflowPolicy, optional): 队列满时的处理策略
+            merge_max_length (int, optional): 合并策略下合并后文本的最大长度，超出部分丢弃，
+                队首消息达到该长度后改为丢弃最早的消息
+            dedup_size (int, optional): 用于去重的最近事件id数量
+            collapse_repeats (bool, optional): 是否合并连续重复的表情和图片
+            reject_notice (str, optional): 拒绝策略下回复给用户的提示
+        """
+        if overflow_policy is OverflowPolicy.MERGE and max_queue_size < 2:
+            raise ValueError("合并策略的队列长度至少为2")
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.merge_max_length = merge_max_length
+        self.dedup_size = dedup_size
+        self.collapse_repeats = collapse_repeats
+        self.reject_notice = reject_notice
+        # 各类处理的累计次数
+        self.stats: Dict[str, int] = {
+            "duplicates": 0,
+            "collapsed": 0,
+            "dropped": 0,
+            "merged": 0,
+            "rejected": 0,
+        }
+        self._recent_event_ids: "OrderedDict[str, None]" = OrderedDict()
+        # 本轮已经提示过拒绝的用户，队列被处理后清除
+        self._rejected_users: Set[str] = set()
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> "IngressGuard":
+        """根据配置文件的 ingress_settings 创建入口防护
+
+        Args:
+            settings (Dict): ingress_settings 配置，缺少的项使用默认值
+
+        Returns:
+            IngressGuard: 入口防护
+        """
+        kwargs = {
+            key: settings[key]
+            for key in ("max_queue_size", "merge_max_length", "dedup_size", "collapse_repeats", "reject_notice")
+            if key in settings
+        }
+        if "overflow_policy" in settings:
+            kwargs["overflow_policy"] = OverflowPolicy[settings["overflow_policy"].upper()]
+        return cls(**kwargs)
+
+    def _count(self, action: str, value: int = 1):
+        self.stats[action] += value
+        metrics.inc("ingress_guard_total", value, action=action)
+
+    def is_duplicate(self, event_id: Optional[str]) -> bool:
+        """检查适配器事件是否重复，不重复时记录该事件id
+
+        Args:
+            event_id (Optional[str]): 适配器事件的消息id，为None时不去重
+
+        Returns:
+            bool: 是否重复
+        """
+        if event_id is None:
+            return False
+        if event_id in self._recent_event_ids:
+            self._recent_event_ids.move_to_end(event_id)
+            self._count("duplicates")
+            return True
+        self._recent_event_ids[event_id] = None
+        if len(self._recent_event_ids) > self.dedup_size:
+            self._recent_event_ids.popitem(last=False)
+        return False
+
+    def forget(self, event_id: Optional[str]):
+        """移除记录的事件id（例如消息解析失败没有入队），之后重新投递的该事件不会被当作重复
+
+        Args:
+            event_id (Optional[str]): 适配器事件的消息id
+        """
+        if event_id is not None:
+            self._recent_event_ids.pop(event_id, None)
+
+    def admit(self, user_id: str, queue: List[KMessage], messages: List[KMessage]) -> Optional[str]:
+        """把新消息放入用户的消息队列（原地修改队列）
+
+        Args:
+            user_id (str): 用户id
+            queue (List[KMessage]): 用户的消息队列
+            messages (List[KMessage]): 新消息
+
+        Returns:
+            Optional[str]: 需要回复给用户的提示，没有则为None
+        """
+        notice = None
+        for message in messages:
+            if self.collapse_repeats and queue and self._is_repeat(queue[-1], message):
+                queue[-1].repeat_count += message.repeat_count
+                self._count("collapsed")
+                continue
+
+            if len(queue) >= self.max_queue_size:
+                if self.overflow_policy is OverflowPolicy.REJECT:
+                    self._count("rejected")
+                    if user_id not in self._rejected_users:
+                        self._rejected_users.add(user_id)
+                        notice = self.reject_notice
+                    continue
+                elif (
+                    self.overflow_policy is OverflowPolicy.DROP_OLDEST
+                    or len(queue[0].to_text()) >= self.merge_max_length
+                    ):
+                    # 队首已经合并到最大长度时，再合并只会把第二条整条截掉，直接丢弃最早的消息
+                    queue.pop(0)
+                    self._count("dropped")
+                else:
+                    queue[0:2] = [self._merge(user_id, queue[0], queue[1])]
+                    self._count("merged")
+
+            queue.append(message)
+        return notice
+
+    def release(self, user_id: str):
+        """用户的消息队列被处理后调用，允许再次提示拒绝
+
+        Args:
+            user_id (str): 用户id
+        """
+        self._rejected_users.discard(user_id)
+
+    @staticmethod
+    def _is_repeat(previous: KMessage, message: KMessage) -> bool:
+        # 无法解码的表情内容为None，不同的表情无法区分，不能合并
+        return (
+            message.message_type in COLLAPSIBLE_MESSAGE_TYPES
+            and message.message_content
+            and previous.message_type is message.message_type
+            and previous.message_content == message.message_content
+        )
+
+    def _merge(self, user_id: str, first: KMessage, second: KMessage) -> KMessage:
+        """把两条消息合并为一条文本消息，超出长度的部分丢弃"""
+        content = first.to_text() + second.to_text()
+        if len(content) > self.merge_max_length:
+            self._count("dropped")
+            content = content[:self.merge_max_length]
+        return KMessage(MessageId(user_id), MessageType.TEXT, first.sender_type, content)
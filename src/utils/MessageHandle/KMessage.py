@@ -1,7 +1,18 @@
+from typing import Dict
 from src.utils.MessageHandle.MessageSenderType import MessageSenderType
 from src.utils.MessageHandle.MessageType import MessageType
 from src.utils.MessageHandle.MessageId import MessageId
 
+# 非文本消息拼接到大模型消息时使用的名称
+MESSAGE_TYPE_NAMES: Dict[MessageType, str] = {
+    MessageType.TEXT: "文本",
+    MessageType.FACE: "表情",
+    MessageType.IMAGE: "图片",
+    MessageType.RECORD: "语音",
+    MessageType.FILE: "文件",
+    MessageType.ANIMATION_FACE: "动画表情",
+}
+
 
 class KMessage:
     """
@@ -12,9 +23,28 @@ class KMessage:
         message_id: MessageId, 
         message_type: MessageType, 
         sender_type: MessageSenderType,
-        message_content: str
+        message_content: str,
+        repeat_count: int = 1
         ):
         self.message_id = message_id
         self.message_type = message_type
         self.sender_type = sender_type
-        self.message_content = message_content
\ No newline at end of file
+        self.message_content = message_content
+        # 连续重复的表情会被合并为一条，这里记录重复次数
+        self.repeat_count = repeat_count
+
+    def to_text(self) -> str:
+        """转换为大模型方便处理的文本
+
+        Returns:
+            str: 文本
+        """
+        if self.message_type is MessageType.TEXT:
+            text = self.message_content
+        elif self.message_content:
+            text = f"[{MESSAGE_TYPE_NAMES[self.message_type]}:{self.message_content}]"
+        else:
+            text = f"[{MESSAGE_TYPE_NAMES[self.message_type]}]"
+        if self.repeat_count > 1:
+            text += f"x{self.repeat_count}"
+        return text
\ No newline at end of file
@@ -6,31 +6,60 @@ import threading
 import time
 import traceback
 from typing import Callable, Dict, List, Optional
+from src.utils.Config import ConfigManager
+from src.utils.MessageHandle.IngressGuard import IngressGuard
 from src.utils.MessageHandle.KMessage import KMessage
 from nonebot.adapters.onebot.v11 import Message, MessageSegment
 from src.utils.MessageHandle.MessageSenderType import MessageSenderType
 from src.utils.MessageHandle.MessageType import MessageType
 from src.utils.MessageHandle.MessageId import MessageId
+from src.utils.MessageHandle.TrafficRecorder import TrafficRecorder
 from nonebot.log import logger
+from src.utils.Metrics import metrics
+from src.utils.Tracing import Span, tracer
 
 
 class MessageManager:
-    def __init__(self, time_interval: int = 10):
+    def __init__(
+        self, 
+        time_interval: int = 10, 
+        traffic_recorder: Optional[TrafficRecorder] = None,
+        ingress_guard: Optional[IngressGuard] = None
+        ):
         # 消息队列，字典是用户id，列表是消息列表
         # 一个Message是一句话（一行）
         # 取末尾的最后一条的生成时间来计算是否需要处理该队列
         self.private_message_queue: Dict[str, List[KMessage]] = {}
         self.private_recent_message_time: Dict[str, datetime] = {}
+        # 队列中第一条消息的入队时间，用于统计防抖等待时间
+        self.private_first_message_time: Dict[str, float] = {}
+        # 入队时记录的追踪区间，每个用户一轮只保留一个合并后的区间，处理该用户队列时挂到这一轮的追踪下
+        self.private_pending_spans: Dict[str, Span] = {}
+        # 队列在nonebot的事件循环中写入、在处理线程中读取，需要加锁
+        self.private_queue_lock: threading.Lock = threading.Lock()
         # 保存私聊消息队列处理线程
         self.private_queue_thread: threading.Thread | None = None
         # 添加一个event来控制线程私聊消息队列线程退出
         self.private_queue_stop_event: threading.Event = threading.Event()
-        self.init_private_queue_handle()
         # 私聊消息队列处理时间间隔（打字等待时间）
-        # 当前疑问：如果处理一个队列时还有消息增加，是否会导致bug
         self.time_interval = time_interval
         # 消息处理器列表
         self.message_processors = []
+        # 入站消息抓包器，为None时不抓包
+        self.traffic_recorder = traffic_recorder
+        # 入口防护，限制队列长度、去重和合并重复表情，没有传入时按配置文件的 ingress_settings 创建
+        if ingress_guard is None:
+            config = ConfigManager(template_path="./src/utils/Config/template.toml")
+            ingress_guard = IngressGuard.from_settings(config.get("ingress_settings", {}))
+        self.ingress_guard = ingress_guard
+        # 处理线程会读取上面的属性，所以最后启动
+        self.init_private_queue_handle()
+
+    def shutdown(self):
+        """停止私聊消息队列处理线程，并关闭入站消息抓包器"""
+        self.private_queue_stop_event.set()
+        if self.traffic_recorder is not None:
+            self.traffic_recorder.close()
 
     def message_processor(self, func):
         """装饰器，用于注册消息处理方法
@@ -59,24 +88,67 @@ class MessageManager:
         # 异步调用所有处理器
         for processor in self.message_processors:
             try:
-                result = await processor(user_id, message)
+                with metrics.timer("process_message_seconds", processor=processor.__name__), \
+                        tracer.span("process_message", processor=processor.__name__):
+                    result = await processor(user_id, message)
                 if result:
                     results.append(result)
             except Exception as e:
+                metrics.inc("process_message_errors_total", processor=processor.__name__)
                 logger.error(f"消息处理器执行异常: {e}\n{traceback.format_exc()}")
         
         # 聚合结果
         return "".join(results)
 
-    async def add_private_message(self, message: Message, user_id: str):
+    async def add_private_message(
+        self, 
+        message: Message, 
+        user_id: str, 
+        event_id: Optional[str] = None
+        ) -> Optional[str]:
         """处理将私聊消息添加到消息队列中
 
         Args:
-            message (KMessage): 消息对象
+            message (Message): 消息对象
+            user_id (str): 消息的来源用户id
+            event_id (Optional[str], optional): 适配器事件的消息id，用于过滤重复事件
+
+        Returns:
+            Optional[str]: 需要回复给用户的提示（例如消息太多被拒绝），没有则为None
         """
-        add_message = self.receive_private_message(message, user_id)
-        self.private_message_queue[message.sender_id] += add_message
-        self.private_recent_message_time[message.sender_id] = datetime.now()
+        if self.traffic_recorder is not None:
+            self.traffic_recorder.record(message, user_id, event_id)
+        with self.private_queue_lock:
+            if self.ingress_guard.is_duplicate(event_id):
+                return None
+        try:
+            with tracer.span("receive_private_message", messages=1, segments=len(message)) as span:
+                add_message = await self.receive_private_message(message, user_id)
+        except Exception:
+            # 解析失败时消息没有入队，移除事件id，让重新投递的事件可以正常处理
+            with self.private_queue_lock:
+                self.ingress_guard.forget(event_id)
+            raise
+        with self.private_queue_lock:
+            queue = self.private_message_queue.setdefault(user_id, [])
+            if not queue:
+                self.private_first_message_time[user_id] = time.perf_counter()
+            notice = self.ingress_guard.admit(user_id, queue, add_message)
+            if span is not None:
+                pending_span = self.private_pending_spans.get(user_id)
+                if pending_span is None:
+                    self.private_pending_spans[user_id] = span
+                else:
+                    # 同一轮的解析区间合并为一个，记录条数和总耗时，避免刷屏时区间无限增长
+                    pending_span.end += span.duration
+                    pending_span.attrs["messages"] += 1
+                    pending_span.attrs["segments"] += len(message)
+            self.private_recent_message_time[user_id] = datetime.now()
+            queue_depth = len(queue)
+            queue_users = len(self.private_message_queue)
+        metrics.observe("private_queue_depth", queue_depth)
+        metrics.set_gauge("private_queue_users", queue_users)
+        return notice
     
     async def receive_private_message(
         self, 
@@ -94,8 +166,9 @@ class MessageManager:
         """
         res: List[KMessage] = []
         for seg in message:
-            message_type = self._format_message_type(seg)
-            message_content = self._format_message_content(seg, message_type)
+            message_type = await self._format_message_type(seg)
+            message_content = await self._format_message_content(seg, message_type)
+            metrics.inc("inbound_segments_total", type=message_type.name)
             res.append(
                 KMessage(
                 MessageId(user_id), 
@@ -146,7 +219,7 @@ class MessageManager:
             str: 必要内容
         """
         if message_type is MessageType.TEXT:
-            return message
+            return message.data["text"]
         elif message_type is MessageType.FACE:
             return await self._decode_face(str(message.data["raw"]))
         elif message_type in [MessageType.IMAGE, MessageType.RECORD, MessageType.FILE, MessageType.ANIMATION_FACE]:
@@ -188,7 +261,7 @@ class MessageManager:
         asyncio.set_event_loop(loop)
         
         try:
-            loop.run_until_complete(target_func)
+            loop.run_until_complete(target_func())
         except Exception as e:
             # 处理异常
             logger.error(f"队列处理器异常: {e} \n 异常信息: {traceback.format_exc()}")
@@ -201,13 +274,44 @@ class MessageManager:
         """
         while not self.private_queue_stop_event.is_set():
             # 按照时间顺序处理私聊消息队列
-            # 遍历用户
-            for user_id, messages in self.private_message_queue.items():
-                # 检查某个用户信息是否超过时间间隔——超过则处理
-                if (
-                    datetime.now() - self.private_recent_message_time[user_id]) < timedelta(seconds=self.time_interval):
-                    # 未超过时间间隔，跳过
-                    continue
-                # 超过时间间隔，处理
-                messages = []
-                # 要遍历消息，处理为大模型方便处理的格式
+            # 遍历用户（取快照，避免遍历时队列被另一个线程修改）
+            with self.private_queue_lock:
+                user_ids = list(self.private_message_queue.keys())
+            for user_id in user_ids:
+                with self.private_queue_lock:
+                    # 检查某个用户信息是否超过时间间隔——超过则处理
+                    if (
+                        datetime.now() - self.private_recent_message_time[user_id]) < timedelta(seconds=self.time_interval):
+                        # 未超过时间间隔，跳过
+                        continue
+                    # 超过时间间隔，取出该用户的队列
+                    messages = self.private_message_queue.pop(user_id)
+                    first_message_time = self.private_first_message_time.pop(user_id, None)
+                    pending_span = self.private_pending_spans.pop(user_id, None)
+                    self.ingress_guard.release(user_id)
+                    queue_users = len(self.private_message_queue)
+                flush_time = time.perf_counter()
+                if first_message_time is not None:
+                    metrics.observe("debounce_wait_seconds", flush_time - first_message_time)
+                metrics.set_gauge("private_queue_users", queue_users)
+                # 这一轮从第一条消息开始解析时算起
+                turn_start = pending_span.start if pending_span is not None else first_message_time
+                with tracer.trace("private_turn", start=turn_start, user_id=user_id, segments=len(messages)):
+                    if pending_span is not None:
+                        tracer.attach(pending_span)
+                    if first_message_time is not None:
+                        tracer.attach(Span("queue_wait", first_message_time, flush_time))
+                    # 要遍历消息，处理为大模型方便处理的格式
+                    await self.process_message(user_id, self._format_private_messages(messages))
+            await asyncio.sleep(0.1)
+
+    def _format_private_messages(self, messages: List[KMessage]) -> str:
+        """将一个用户队列中的消息拼接为大模型方便处理的格式
+
+        Args:
+            messages (List[KMessage]): 用户队列中的消息
+
+        Returns:
+            str: 拼接后的消息
+        """
+        return "".join(message.to_text() for message in messages)
@@ -0,0 +1,12 @@
+from enum import Enum, auto
+
+class OverflowPolicy(Enum):
+    """
+    私聊消息队列溢出策略枚举
+    """
+    # 丢弃队列中最早的消息
+    DROP_OLDEST = auto()
+    # 把队列中最早的两条消息合并为一条文本
+    MERGE = auto()
+    # 拒绝新消息，并提示用户
+    REJECT = auto()
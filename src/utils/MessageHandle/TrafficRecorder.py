@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple
+from nonebot.adapters.onebot.v11 import Message, MessageSegment
+
+# 抓包文件格式版本
+CAPTURE_VERSION = 1
+
+# 记录时丢弃的消息段字段（回放用不到，且占空间）
+_DROPPED_SEGMENT_KEYS = {"url"}
+
+
+class TrafficRecorder:
+    """
+    私聊入站消息抓包器，在 MessageManager 入口处记录消息，用于离线回放
+    文件为追加写入的JSON Lines：
+    第一行是文件头，之后每行是 [距开始的毫秒数, 匿名用户id, [[消息段类型, 消息段数据], ...], 适配器事件id]
+    适配器事件id可能为null，回放时用它重现重复事件的过滤
+    """
+
+    def __init__(self, path: str, salt: Optional[bytes] = None):
+        """初始化抓包器
+
+        Args:
+            path (str): 抓包文件路径，已存在时追加一段新的抓包
+            salt (Optional[bytes], optional): 用户id匿名化使用的密钥，默认随机生成（不写入文件，无法还原）
+        """
+        self._path = Path(path)
+        self._salt = salt if salt is not None else os.urandom(16)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # 行缓冲，每条记录写完立即落盘，长时间没有消息或进程被结束时不会丢失最后的记录
+        self._file = open(self._path, 'a', encoding='utf-8', buffering=1)
+        self._write_line({"version": CAPTURE_VERSION, "start": datetime.now().isoformat()})
+
+    def anonymize(self, user_id: str) -> str:
+        """将用户id匿名化，同一次抓包中同一用户的结果相同
+
+        Args:
+            user_id (str): 用户id
+
+        Returns:
+            str: 匿名用户id
+        """
+        return hmac.new(self._salt, user_id.encode(), hashlib.sha256).hexdigest()[:12]
+
+    def record(self, message: Message, user_id: str, event_id: Optional[str] = None):
+        """记录一条入站消息
+
+        Args:
+            message (Message): NoneBot收到的消息
+            user_id (str): 消息的来源用户id
+            event_id (Optional[str], optional): 适配器事件的消息id
+        """
+        offset = int((time.monotonic() - self._start) * 1000)
+        segments = [
+            [seg.type, {key: value for key, value in seg.data.items() if key not in _DROPPED_SEGMENT_KEYS}]
+            for seg in message
+        ]
+        self._write_line([offset, self.anonymize(user_id), segments, event_id])
+
+    def _write_line(self, data: Any):
+        line = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+
+    def close(self):
+        """写入剩余内容并关闭文件"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, str, Message, Optional[str]]]:
+    """读取抓包文件
+
+    同一文件中的多段抓包首尾相接，后一段的时间接在前一段最后一条消息之后
+
+    Args:
+        path (str): 抓包文件路径
+
+    Yields:
+        Tuple[float, str, Message, Optional[str]]: (距开始的秒数, 匿名用户id, 消息, 适配器事件id)
+    """
+    base = 0.0
+    last = 0.0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if isinstance(data, dict):
+                # 新的一段抓包
+                if data.get("version") != CAPTURE_VERSION:
+                    raise ValueError(f"不支持的抓包文件版本: {data.get('version')}")
+                base = last
+                continue
+            offset_ms, user_id, segments = data[:3]
+            # 早期的抓包没有记录事件id
+            event_id = data[3] if len(data) > 3 else None
+            last = base + offset_ms / 1000
+            message = Message(MessageSegment(seg_type, seg_data) for seg_type, seg_data in segments)
+            yield last, user_id, message, event_id
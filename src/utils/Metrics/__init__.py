@@ -0,0 +1,286 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from nonebot.log import logger
+
+# 标签以排好序的 (key, value) 元组保存，方便作为字典键
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 默认的耗时直方图桶（单位：秒），覆盖防抖等待和大模型调用这种秒级耗时
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+# 指标说明，导出Prometheus文本时作为HELP
+METRIC_HELP: Dict[str, str] = {
+    "inbound_segments_total": "收到的私聊消息段数量",
+    "private_queue_depth": "入队后该用户私聊消息队列中的消息段数量",
+    "private_queue_users": "私聊消息队列中等待处理的用户数",
+    "debounce_wait_seconds": "私聊消息从首条入队到开始处理的等待时间",
+    "process_message_seconds": "单个消息处理器的执行时间",
+    "process_message_errors_total": "消息处理器执行异常次数",
+    "api_response_seconds": "大模型api_response调用耗时",
+    "api_response_tokens_total": "大模型回复的token数（估算）",
+    "api_response_tokens_per_second": "大模型回复的token吞吐",
+    "run_hooks_seconds": "上下文钩子函数执行耗时",
+    "ingress_guard_total": "私聊消息入口防护处理次数（按去重、合并表情、丢弃、合并、拒绝分类）",
+}
+
+# 不是耗时的直方图使用各自的桶
+METRIC_BUCKETS: Dict[str, Tuple[float, ...]] = {
+    "private_queue_depth": (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    "api_response_tokens_per_second": (1, 5, 10, 20, 50, 100, 200, 500, 1000, 2000),
+}
+
+
+class Histogram:
+    """直方图，使用固定的桶统计分布"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # 最后一个桶为 +Inf
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """记录一个观测值"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上界），没有数据时返回None"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class _Timer:
+    """计时上下文管理器，退出时把耗时记录到直方图"""
+
+    __slots__ = ("_manager", "_name", "_labels", "_start")
+
+    def __init__(self, manager: "MetricsManager", name: str, labels: Dict[str, str]):
+        self._manager = manager
+        self._name = name
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._manager.observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class _NullTimer:
+    """关闭指标时使用的空计时器"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsManager:
+    """
+    指标管理器，提供计数器、仪表和直方图
+    关闭时所有记录方法直接返回，几乎没有开销
+    """
+
+    def __init__(self, enabled: bool = False):
+        """初始化指标管理器
+
+        Args:
+            enabled (bool, optional): 是否启用指标收集
+        """
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        # 消息队列处理在独立线程中运行，需要加锁
+        self._lock = threading.Lock()
+        self._dump_thread: Optional[threading.Thread] = None
+        self._dump_stop_event = threading.Event()
+
+    @staticmethod
+    def _label_key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """计数器增加
+
+        Args:
+            name (str): 指标名
+            value (float, optional): 增加的值
+            **labels: 指标标签
+        """
+        if not self.enabled:
+            return
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """设置仪表当前值
+
+        Args:
+            name (str): 指标名
+            value (float): 当前值
+            **labels: 指标标签
+        """
+        if not self.enabled:
+            return
+        key = self._label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """记录直方图观测值
+
+        Args:
+            name (str): 指标名
+            value (float): 观测值
+            **labels: 指标标签
+        """
+        if not self.enabled:
+            return
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(METRIC_BUCKETS.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels: str):
+        """返回一个计时上下文管理器，退出时将耗时（秒）记录到直方图
+
+        Args:
+            name (str): 指标名
+            **labels: 指标标签
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        """清空所有已收集的指标"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key)
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def render_prometheus(self) -> str:
+        """导出为Prometheus文本格式
+
+        Returns:
+            str: Prometheus文本格式的指标
+        """
+        lines: List[str] = []
+        with self._lock:
+            for metric_type, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    if name in METRIC_HELP:
+                        lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{self._format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(key, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """生成便于阅读的指标摘要，用于定时写入日志
+
+        Returns:
+            str: 指标摘要
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                for key, value in series.items():
+                    lines.append(f"{name}{self._format_labels(key)} = {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                for key, value in series.items():
+                    lines.append(f"{name}{self._format_labels(key)} = {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                for key, histogram in series.items():
+                    if histogram.count == 0:
+                        continue
+                    lines.append(
+                        f"{name}{self._format_labels(key)} "
+                        f"count={histogram.count} avg={histogram.sum / histogram.count:.4f} "
+                        f"p50<={histogram.quantile(0.5)} p99<={histogram.quantile(0.99)}"
+                    )
+        return "\n".join(lines)
+
+    def start_log_dump(self, interval: float = 60):
+        """启动定时将指标摘要写入日志的线程
+
+        Args:
+            interval (float, optional): 写入间隔（单位：秒）
+        """
+        if self._dump_thread is not None and self._dump_thread.is_alive():
+            return
+        self._dump_stop_event.clear()
+        self._dump_thread = threading.Thread(target=self._log_dump_loop, args=(interval,))
+        self._dump_thread.daemon = True
+        self._dump_thread.start()
+
+    def stop_log_dump(self):
+        """停止定时写入日志的线程"""
+        self._dump_stop_event.set()
+        self._dump_thread = None
+
+    def _log_dump_loop(self, interval: float):
+        while not self._dump_stop_event.wait(interval):
+            summary = self.summary()
+            if summary:
+                logger.info(f"指标统计:\n{summary}")
+
+
+# 全局指标管理器，默认关闭，由配置启用
+metrics = MetricsManager()
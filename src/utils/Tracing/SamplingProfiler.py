@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional, Set
+
+
+class SamplingProfiler:
+    """
+    采样分析器，在独立线程中定时采集其他线程的调用栈
+    结果为折叠栈格式（每行 "栈帧;栈帧;... 次数"），可以直接交给 flamegraph.pl 或 speedscope 生成火焰图
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Set[int]] = None):
+        """初始化采样分析器
+
+        Args:
+            interval (float, optional): 采样间隔（单位：秒）
+            thread_ids (Optional[Set[int]], optional): 只采样这些线程，None为采样所有线程
+        """
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """开始采样"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止采样并等待采样线程退出"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """导出折叠栈格式的采样结果"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+async def profile_for(seconds: float, interval: float = 0.005, current_thread_only: bool = False) -> str:
+    """在不阻塞事件循环的情况下采样一段时间
+
+    Args:
+        seconds (float): 采样时长（单位：秒）
+        interval (float, optional): 采样间隔（单位：秒）
+        current_thread_only (bool, optional): 是否只采样当前事件循环所在的线程
+
+    Returns:
+        str: 折叠栈格式的采样结果
+    """
+    profiler = SamplingProfiler(interval, {threading.get_ident()} if current_thread_only else None)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.folded()
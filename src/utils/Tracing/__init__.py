@@ -0,0 +1,196 @@
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+
+class Span:
+    """一段计时区间，可以嵌套子区间"""
+
+    __slots__ = ("name", "start", "end", "attrs", "children")
+
+    def __init__(self, name: str, start: Optional[float] = None, end: Optional[float] = None, **attrs: Any):
+        """初始化区间
+
+        Args:
+            name (str): 区间名
+            start (Optional[float], optional): 开始时间（time.perf_counter），默认为当前时间
+            end (Optional[float], optional): 结束时间（time.perf_counter）
+            **attrs: 区间属性
+        """
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end = end
+        self.attrs: Dict[str, Any] = attrs
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        """区间耗时（单位：秒），未结束时计算到当前时间"""
+        return (time.perf_counter() if self.end is None else self.end) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """将区间转换为字典"""
+        return {
+            "name": self.name,
+            "duration": self.duration,
+            "attrs": self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Trace:
+    """一轮对话的追踪，包含一棵区间树"""
+
+    def __init__(self, root: Span, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.root = root
+        # 是否已经绑定到对话记录ID
+        self.record_bound = False
+
+    @property
+    def duration(self) -> float:
+        """整轮耗时（单位：秒）"""
+        return self.root.duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        """将追踪转换为字典"""
+        return {"trace_id": self.trace_id, **self.root.to_dict()}
+
+    def format(self) -> str:
+        """格式化为便于阅读的区间树"""
+        lines = [f"trace {self.trace_id} {self.duration * 1000:.1f}ms"]
+        self._format_span(self.root, self.root.start, 0, lines)
+        return "\n".join(lines)
+
+    def _format_span(self, span: Span, origin: float, depth: int, lines: List[str]):
+        attrs = " ".join(f"{key}={value}" for key, value in span.attrs.items())
+        lines.append(
+            f"{'  ' * depth}- {span.name} +{(span.start - origin) * 1000:.1f}ms "
+            f"{span.duration * 1000:.1f}ms{' ' + attrs if attrs else ''}"
+        )
+        for child in span.children:
+            self._format_span(child, origin, depth + 1, lines)
+
+
+# 当前任务所在的追踪和区间，asyncio的每个任务有各自的上下文
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    追踪管理器，记录每轮对话的区间树，并把慢的追踪保存在环形缓冲区中
+    关闭时所有方法直接返回，几乎没有开销
+    """
+
+    def __init__(self, enabled: bool = False, slow_threshold: float = 10.0, buffer_size: int = 50):
+        """初始化追踪管理器
+
+        Args:
+            enabled (bool, optional): 是否启用追踪
+            slow_threshold (float, optional): 耗时超过该值（单位：秒）的追踪会被保存
+            buffer_size (int, optional): 保存的慢追踪数量上限，超过时丢弃最早的
+        """
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self._slow_traces: Deque[Trace] = deque(maxlen=buffer_size)
+        # 追踪在消息队列处理线程中完成，在nonebot的事件循环中读取
+        self._lock = threading.Lock()
+
+    def set_buffer_size(self, buffer_size: int):
+        """修改慢追踪的保存数量上限"""
+        with self._lock:
+            self._slow_traces = deque(self._slow_traces, maxlen=buffer_size)
+
+    @contextmanager
+    def trace(self, name: str, start: Optional[float] = None, **attrs: Any) -> Iterator[Optional[Trace]]:
+        """开始一轮追踪，已经在追踪中时相当于span
+
+        Args:
+            name (str): 根区间名
+            start (Optional[float], optional): 开始时间（time.perf_counter），用于把入队等更早的阶段计入
+            **attrs: 根区间属性
+
+        Yields:
+            Optional[Trace]: 追踪，关闭时为None
+        """
+        if not self.enabled:
+            yield None
+            return
+        if _current_trace.get() is not None:
+            with self.span(name, **attrs):
+                yield _current_trace.get()
+            return
+
+        trace = Trace(Span(name, start, **attrs))
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+        try:
+            yield trace
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if trace.duration >= self.slow_threshold:
+                with self._lock:
+                    self._slow_traces.append(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        """记录一个区间，挂在当前区间下；不在追踪中时区间不挂到任何地方，可以之后用attach加入
+
+        Args:
+            name (str): 区间名
+            **attrs: 区间属性
+
+        Yields:
+            Optional[Span]: 区间，关闭时为None
+        """
+        if not self.enabled:
+            yield None
+            return
+        span = Span(name, **attrs)
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+
+    def attach(self, *spans: Span):
+        """把已经结束的区间挂到当前区间下（例如入队时记录的区间）"""
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.extend(spans)
+
+    def bind_record(self, record_id: str):
+        """当前追踪还没有绑定对话记录时，使用该对话记录ID作为追踪ID
+
+        Args:
+            record_id (str): ConversationRecord.id
+        """
+        trace = _current_trace.get()
+        if trace is not None and not trace.record_bound:
+            trace.trace_id = record_id
+            trace.record_bound = True
+
+    def get_slow_traces(self) -> List[Trace]:
+        """获取保存的慢追踪（从旧到新）"""
+        with self._lock:
+            return list(self._slow_traces)
+
+    def clear(self):
+        """清空保存的慢追踪"""
+        with self._lock:
+            self._slow_traces.clear()
+
+
+# 全局追踪管理器，默认关闭，由配置启用
+tracer = Tracer()